@@ -0,0 +1,88 @@
+# Imports
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmark Parameters
+nb_repeats = 5
+sim_time = 200000
+
+
+def interpreter_time(code):
+    """
+    Measures the wall-clock time of a fresh interpreter running the code.
+    :param code: The Python code to run.
+    :return: Returns the median time in seconds over nb_repeats runs.
+    """
+    times = []
+    for _ in range(nb_repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+def import_model():
+    """
+    Imports the third article's model in a worker process.
+    :return: Returns the import time in seconds and the heavy modules, which were imported.
+    """
+    start = time.perf_counter()
+    import third_article_features
+    import_time = time.perf_counter() - start
+
+    return import_time, [module for module in ('pandas', 'scipy') if module in sys.modules]
+
+
+def worker_startup():
+    """
+    Starts a fresh worker process (spawn, like on Windows / macOS) and waits for its first task.
+    :return: Returns the startup time, the import time inside the worker and the loaded heavy modules.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        import_time, heavy_modules = executor.submit(import_model).result()
+        startup_time = time.perf_counter() - start
+
+    return startup_time, import_time, heavy_modules
+
+
+def simulation_throughput():
+    """
+    Runs one replication without printing and DataFrames.
+    :return: Returns the run time in seconds, the created orders per second and the processed events per second.
+    """
+    import third_article_features as model
+    from live_monitor import count_events
+
+    model.verbose = False
+    model.collect_dataframes = False
+    environment = model.setup_simulation(seed=1)
+    counter = count_events(environment)
+    start = time.perf_counter()
+    environment.run(until=sim_time)
+    run_time = time.perf_counter() - start
+
+    return run_time, model.order_number / run_time, counter.count / run_time
+
+
+if __name__ == '__main__':
+    interpreter = interpreter_time('pass')
+    print(f"###Benchmark: Interpreter startup {interpreter * 1000:.1f} ms.")
+    model_import = interpreter_time('import third_article_features') - interpreter
+    print(f"###Benchmark: Import of the model {model_import * 1000:.1f} ms.")
+    print(f"###Benchmark: Import of the model with pandas "
+          f"{(interpreter_time('import third_article_features, pandas') - interpreter) * 1000:.1f} ms.")
+
+    startup_times = [worker_startup() for _ in range(nb_repeats)]
+    print(f"###Benchmark: Worker startup {statistics.median(t[0] for t in startup_times) * 1000:.1f} ms "
+          f"(import in worker {statistics.median(t[1] for t in startup_times) * 1000:.1f} ms, "
+          f"heavy modules loaded: {startup_times[0][2]}).")
+
+    run_time, orders_per_second, events_per_second = simulation_throughput()
+    print(f"###Benchmark: Run of {sim_time} took {run_time:.2f} s ({orders_per_second:.0f} orders/s, "
+          f"{events_per_second:.0f} events/s).")
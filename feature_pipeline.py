@@ -0,0 +1,220 @@
+# Imports
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import queue
+import numpy as np
+
+# Feature schema (column order of X)
+feature_schema = ('product_type',
+                  'wip',
+                  'nb_order_queue_routing',
+                  'last_sftt',
+                  'last_5_sftt_mean',
+                  'last_5_sftt_median',
+                  'last_50_sftt_mean',
+                  'last_50_sftt_median',
+                  'nb_operations',
+                  'due_date_slack',
+                  'order_pool_size',
+                  )
+feature_dtype = np.float32
+
+
+class FeatureBuffer:
+    """
+    This class stores the features of each order until the order is finished. Afterwards the features and the
+    orders' SFTT (target) are written into preallocated float32 chunks.
+    """
+
+    def __init__(self, chunk_size=100000):
+        """
+        Here the variables for the buffer are defined.
+        :param chunk_size: Number of rows of each (X, y) chunk.
+        """
+        self.chunk_size = chunk_size
+        self.pending = dict()  # Features of the orders, which are not finished yet
+        self.chunks = []  # Full (X, y) chunks, which were not taken yet
+        self.nb_rows = 0
+        self.X = np.empty((chunk_size, len(feature_schema)), dtype=feature_dtype)
+        self.y = np.empty(chunk_size, dtype=feature_dtype)
+
+    def add_features(self, order_id, features):
+        """
+        Stores the features of a newly created order.
+        :param order_id: The orders ID.
+        :param features: The orders' features in the order of feature_schema.
+        """
+        self.pending[order_id] = features
+
+    def add_target(self, order_id, sftt):
+        """
+        Writes the features and the SFTT of a finished order into the current chunk.
+        :param order_id: The orders ID.
+        :param sftt: The orders' SFTT.
+        """
+        features = self.pending.pop(order_id, None)
+        if features is None:
+            return
+
+        self.X[self.nb_rows] = features
+        self.y[self.nb_rows] = sftt
+        self.nb_rows += 1
+
+        if self.nb_rows == self.chunk_size:
+            self.chunks.append((self.X, self.y))
+            self.nb_rows = 0
+            self.X = np.empty((self.chunk_size, len(feature_schema)), dtype=feature_dtype)
+            self.y = np.empty(self.chunk_size, dtype=feature_dtype)
+
+    def take_chunks(self, flush=False):
+        """
+        Takes the full chunks out of the buffer.
+        :param flush: If True, also the partly filled chunk is taken.
+        :return: Returns a list of (X, y) chunks.
+        """
+        chunks = self.chunks
+        self.chunks = []
+
+        if flush and self.nb_rows > 0:
+            chunks.append((self.X[:self.nb_rows].copy(), self.y[:self.nb_rows].copy()))
+            self.nb_rows = 0
+
+        return chunks
+
+
+def iter_feature_chunks(sim_time, seed=None, chunk_size=100000, step_time=14400):
+    """
+    Runs one replication of the model and yields the (X, y) chunks as soon as they are full.
+    :param sim_time: The simulation run time.
+    :param seed: The seed of the replication.
+    :param chunk_size: Number of rows of each chunk.
+    :param step_time: The simulation time after which the full chunks are handed out.
+    :return: Yields (X, y) tuples of float32 arrays, X has the columns of feature_schema and y is the SFTT.
+    """
+    import third_article_features as model
+
+    # The model is configured for the feature collection and restored afterwards, also if the caller stops early
+    settings = {'collect_dataframes': model.collect_dataframes, 'verbose': model.verbose,
+                'feature_buffer': model.feature_buffer}
+    model.collect_dataframes = False
+    model.verbose = False
+    model.feature_buffer = FeatureBuffer(chunk_size)
+    try:
+        environment = model.setup_simulation(seed=seed)
+
+        until = 0
+        while until < sim_time:
+            until = min(until + step_time, sim_time)
+            environment.run(until=until)
+            yield from model.feature_buffer.take_chunks()
+
+        yield from model.feature_buffer.take_chunks(flush=True)
+    finally:
+        for name, value in settings.items():
+            setattr(model, name, value)
+
+
+# Queue and stop event of the worker processes, set by set_worker_queue()
+chunk_queue = None
+stop_event = None
+
+
+def set_worker_queue(worker_chunk_queue, worker_stop_event):
+    """
+    Sets the queue, into which a worker process puts its chunks, and the event, which stops the replications.
+    :param worker_chunk_queue: The multiprocessing queue of the chunks.
+    :param worker_stop_event: The multiprocessing event, which is set if no more chunks are needed.
+    """
+    global chunk_queue, stop_event
+    chunk_queue = worker_chunk_queue
+    stop_event = worker_stop_event
+
+
+def replication_features(sim_time, seed, chunk_size=100000):
+    """
+    Runs one replication in a worker process and puts every chunk into the chunk queue as soon as it is full, so only
+    a few chunks are held in memory. The end of the replication is marked by (seed, None).
+    :param sim_time: The simulation run time.
+    :param seed: The seed of the replication.
+    :param chunk_size: Number of rows of each chunk.
+    :return: Returns the number of chunks of the replication.
+    """
+    nb_chunks = 0
+    try:
+        for chunk in iter_feature_chunks(sim_time, seed=seed, chunk_size=chunk_size):
+            if stop_event.is_set():
+                break
+            chunk_queue.put((seed, chunk))
+            nb_chunks += 1
+    finally:
+        chunk_queue.put((seed, None))
+
+    return nb_chunks
+
+
+def iter_replication_feature_chunks(sim_time, seeds, chunk_size=100000, max_workers=None, max_queued_chunks=4):
+    """
+    Runs one replication per seed in parallel worker processes and yields the (X, y) chunks of the replications
+    as soon as a worker has filled them (the chunks of different replications are interleaved).
+    :param sim_time: The simulation run time of each replication.
+    :param seeds: The seeds of the replications.
+    :param chunk_size: Number of rows of each chunk.
+    :param max_workers: Number of worker processes (None uses all CPUs).
+    :param max_queued_chunks: Number of chunks, which may wait in the queue before the workers pause.
+    :return: Yields (X, y) tuples of float32 arrays.
+    """
+    seeds = list(seeds)
+    worker_chunk_queue = multiprocessing.Queue(maxsize=max_queued_chunks)
+    worker_stop_event = multiprocessing.Event()
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=set_worker_queue,
+                             initargs=(worker_chunk_queue, worker_stop_event)) as executor:
+        futures = [executor.submit(replication_features, sim_time, seed, chunk_size) for seed in seeds]
+        nb_running = len(futures)
+        try:
+            while nb_running > 0:
+                try:
+                    seed, chunk = worker_chunk_queue.get(timeout=1)
+                except queue.Empty:
+                    # A crashed worker never marks the end of its replication
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+
+                if chunk is None:
+                    nb_running -= 1
+                else:
+                    yield chunk
+
+            # Exceptions of the replications
+            for future in futures:
+                future.result()
+        finally:
+            if nb_running > 0:
+                # Stopped early: the replications, which did not start yet, are cancelled and the running ones are
+                # stopped. The queue is emptied, so no worker waits for free space.
+                worker_stop_event.set()
+                nb_running -= sum(future.cancel() for future in futures)
+                while nb_running > 0:
+                    try:
+                        seed, chunk = worker_chunk_queue.get(timeout=1)
+                    except queue.Empty:
+                        if all(future.done() for future in futures):
+                            break
+                        continue
+                    if chunk is None:
+                        nb_running -= 1
+
+
+def feature_matrix(chunks):
+    """
+    Concatenates (X, y) chunks into one feature matrix and target vector.
+    :param chunks: Iterable of (X, y) chunks.
+    :return: Returns X and y.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return np.empty((0, len(feature_schema)), dtype=feature_dtype), np.empty(0, dtype=feature_dtype)
+
+    return np.concatenate([X for X, y in chunks]), np.concatenate([y for X, y in chunks])
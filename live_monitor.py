@@ -0,0 +1,170 @@
+# Imports
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+class EventCounter:
+    """
+    This class counts the events processed by a SimPy Environment(). The step() method of the environment is wrapped,
+    so every processed event is counted once.
+    """
+
+    def __init__(self, environment):
+        """
+        Here the variables for the counter are defined and the step() method of the environment is wrapped.
+        :param environment: SimPy Environment()
+        """
+        self.count = 0
+        step = environment.step
+
+        def counted_step():
+            self.count += 1
+            step()
+
+        environment.step = counted_step
+
+
+def count_events(environment):
+    """
+    Starts counting the processed events of an environment. The counter is stored in the environment, so the events
+    are counted once, even if several monitors count them.
+    :param environment: SimPy Environment()
+    :return: Returns the EventCounter of the environment.
+    """
+    counter = getattr(environment, 'event_counter', None)
+    if counter is None:
+        counter = EventCounter(environment)
+        environment.event_counter = counter
+
+    return counter
+
+
+def peak_memory_kb():
+    """
+    Reads the peak memory (maximum resident set size) of the process so far.
+    :return: Returns the peak memory in KB (None, if it is not available on this platform).
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class LiveMonitor:
+    """
+    This class samples the progress of a long run (events/sec, sim-time/wall-time ratio, WIP, order pool size,
+    finished/early/tardy orders and peak memory). The samples are written as JSON lines and can be scraped from a local
+    HTTP endpoint in the Prometheus text format.
+    """
+
+    def __init__(self, sim_time, interval=5.0, check_time=360, json_stream=sys.stderr, port=None):
+        """
+        Here the variables for the monitor are defined.
+        :param sim_time: The simulation run time, used for the ETA.
+        :param interval: Wall-clock seconds between two samples.
+        :param check_time: Simulation time between two checks of the wall clock.
+        :param json_stream: Stream the JSON lines are written to (None writes no JSON lines).
+        :param port: Port of the local HTTP endpoint (None starts no endpoint).
+        """
+        self.sim_time = sim_time
+        self.interval = interval
+        self.check_time = check_time
+        self.json_stream = json_stream
+        self.latest = dict()
+        self.server = None
+
+        if port is not None:
+            self.start_server(port)
+
+    def monitor(self, environment, current_metrics):
+        """
+        SimPy process, which checks the wall clock every check_time and samples the metrics, if the interval passed.
+        :param environment: SimPy Environment()
+        :param current_metrics: Function returning the models' current metrics as dict.
+        """
+        start_wall = last_wall = time.perf_counter()
+        start_now = last_now = environment.now
+        counter = count_events(environment)
+        last_events = counter.count
+
+        while True:
+            yield environment.timeout(self.check_time)
+
+            wall = time.perf_counter()
+            if wall - last_wall < self.interval:
+                continue
+
+            events = counter.count
+            sim_rate = (environment.now - start_now) / (wall - start_wall)
+            sample = {'wall_time': wall - start_wall,
+                      'sim_time': environment.now,
+                      'events_per_sec': (events - last_events) / (wall - last_wall),
+                      'sim_wall_ratio': (environment.now - last_now) / (wall - last_wall),
+                      'eta_seconds': max(self.sim_time - environment.now, 0) / sim_rate if sim_rate > 0 else None,
+                      'peak_rss_kb': peak_memory_kb(),
+                      }
+            sample.update(current_metrics())
+            self.latest = sample
+
+            if self.json_stream is not None:
+                self.json_stream.write(json.dumps(sample) + '\n')
+                self.json_stream.flush()
+
+            last_wall, last_now, last_events = wall, environment.now, events
+
+    def prometheus_text(self):
+        """
+        Formats the latest sample in the Prometheus text format.
+        :return: Returns the metrics as text.
+        """
+        lines = []
+        for name, value in self.latest.items():
+            if value is not None:
+                lines.append(f"# TYPE simpy_{name} gauge")
+                lines.append(f"simpy_{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def start_server(self, port):
+        """
+        Serves the latest sample on http://127.0.0.1:<port>/metrics (Prometheus text) and /json in a daemon thread.
+        :param port: Port of the endpoint.
+        """
+        monitor = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/json':
+                    body, content_type = json.dumps(monitor.latest).encode(), 'application/json'
+                else:
+                    body, content_type = monitor.prometheus_text().encode(), 'text/plain; version=0.0.4'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop_server(self):
+        """
+        Stops the HTTP endpoint.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
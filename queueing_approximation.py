@@ -0,0 +1,212 @@
+# Imports
+import math
+import numpy as np
+from scipy.linalg import expm
+
+
+def erlang_c_queue_length(arrival_rate, processing_time, capacity):
+    """
+    Calculates the expected queue length of an M/M/c station with the Erlang C formula.
+    :param arrival_rate: Arrival rate of the orders at the station.
+    :param processing_time: Mean processing time.
+    :param capacity: Number of machines of the station.
+    :return: Returns the expected number of orders waiting in the queue (inf, if the station is overloaded).
+    """
+    offered_load = arrival_rate * processing_time
+    utilization = offered_load / capacity
+    if utilization >= 1:
+        return math.inf
+
+    summed_terms = sum(offered_load ** k / math.factorial(k) for k in range(capacity))
+    last_term = offered_load ** capacity / (math.factorial(capacity) * (1 - utilization))
+    probability_wait = last_term / (summed_terms + last_term)
+
+    return probability_wait * utilization / (1 - utilization)
+
+
+def sftt_distribution(sojourn_times, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Approximates the SFTT of a product type as sum of independent exponential sojourn times at the stations on its
+    routing (exact for Jackson networks of single machine stations). The sum is a phase-type distribution, so the
+    quantiles are calculated from the matrix exponential of its generator.
+    :param sojourn_times: Mean sojourn time at each station on the routing.
+    :param quantiles: The quantiles to calculate.
+    :return: Returns a dict with the mean, std and the quantiles of the SFTT.
+    """
+    distribution = {'mean': sum(sojourn_times),
+                    'std': math.sqrt(sum(sojourn_time ** 2 for sojourn_time in sojourn_times))}
+
+    if math.isinf(distribution['mean']):
+        for quantile in quantiles:
+            distribution[f'p{round(quantile * 100)}'] = math.inf
+        return distribution
+
+    # Generator of the phases, one phase per station on the routing
+    nb_phases = len(sojourn_times)
+    generator = np.zeros((nb_phases, nb_phases))
+    for phase, sojourn_time in enumerate(sojourn_times):
+        generator[phase, phase] = -1 / sojourn_time
+        if phase + 1 < nb_phases:
+            generator[phase, phase + 1] = 1 / sojourn_time
+
+    def cdf(time):
+        return 1 - expm(generator * time)[0].sum()
+
+    for quantile in quantiles:
+        # Bisection between 0 and an upper bound, where the cdf exceeds the quantile
+        lower, upper = 0.0, distribution['mean']
+        while cdf(upper) < quantile:
+            upper *= 2
+        for _ in range(50):
+            middle = (lower + upper) / 2
+            if cdf(middle) < quantile:
+                lower = middle
+            else:
+                upper = middle
+        distribution[f'p{round(quantile * 100)}'] = upper
+
+    return distribution
+
+
+def batch_release_scv(period_length, new_order_time):
+    """
+    Approximates the squared coefficient of variation of the arrivals at the shop, if the orders are released in
+    batches at the start of each period (as by bil() of third_article_features.py). A batch of b orders every period
+    has b - 1 interarrival times of 0 and one of period_length, so the SCV of the interarrival times is b - 1.
+    :param period_length: The time between two releases.
+    :param new_order_time: Mean time between two new orders.
+    :return: Returns the SCV of the interarrival times (0 for at most one order per period).
+    """
+    return max(period_length / new_order_time - 1, 0.0)
+
+
+def approximate_shop(routing, capacities=None, new_order_time=80, processing_time=100, product_mix=None,
+                     arrival_scv=1.0, processing_scv=1.0, iterations=50):
+    """
+    Solves the shop as open queueing network. With exponential interarrival and processing times (scv = 1) this is
+    the Jackson network solution, otherwise the variability of the flows between the stations is propagated as in
+    QNA and the waiting times are approximated with the Allen-Cunneen formula.
+    :param routing: Routing of the product types (e.g. routing of third_article_features.py).
+    :param capacities: Number of machines per station (None uses one machine per station).
+    :param new_order_time: Mean time between two new orders.
+    :param processing_time: Mean processing time at the stations.
+    :param product_mix: Probability of each product type (None uses equally likely product types).
+    :param arrival_scv: Squared coefficient of variation of the interarrival times.
+    :param processing_scv: Squared coefficient of variation of the processing times.
+    :param iterations: Number of iterations for the variability of the flows.
+    :return: Returns a dict with 'stations' (utilization, overloaded, queue length, waiting and sojourn time per
+    station) and 'sftt' (SFTT distribution per product type). The queues of overloaded stations (utilization >= 1)
+    grow without limit, so their queue length and the SFTT of the product types passing them are inf.
+    """
+    stations = sorted({station for stations in routing.values() for station in stations})
+    if capacities is None:
+        capacities = {station: 1 for station in stations}
+    if product_mix is None:
+        product_mix = {product_type: 1 / len(routing) for product_type in routing.keys()}
+
+    # Arrival rate of each flow (product type and position on its routing)
+    order_rate = 1 / new_order_time
+    arrival_rate = {station: 0.0 for station in stations}
+    for product_type, product_stations in routing.items():
+        for station in product_stations:
+            arrival_rate[station] += order_rate * product_mix[product_type]
+
+    utilization = {station: arrival_rate[station] * processing_time / capacities[station] for station in stations}
+
+    # Variability of the arrivals at the stations, merged from the external and internal flows
+    station_arrival_scv = {station: arrival_scv for station in stations}
+    for _ in range(iterations):
+        departure_scv = dict()
+        for station in stations:
+            rho = min(utilization[station], 1.0)
+            departure_scv[station] = (1 + (1 - rho ** 2) * (station_arrival_scv[station] - 1)
+                                      + rho ** 2 * (processing_scv - 1) / math.sqrt(capacities[station]))
+
+        merged_scv = {station: 0.0 for station in stations}
+        for product_type, product_stations in routing.items():
+            flow_rate = order_rate * product_mix[product_type]
+            for position, station in enumerate(product_stations):
+                # The flow is split from the external arrivals or the departures of the previous station with the
+                # probability split, which makes its arrivals more random (QNA: split * scv + 1 - split)
+                if position == 0:
+                    split = product_mix[product_type]
+                    flow_scv = split * arrival_scv + 1 - split
+                else:
+                    previous_station = product_stations[position - 1]
+                    split = flow_rate / arrival_rate[previous_station]
+                    flow_scv = split * departure_scv[previous_station] + 1 - split
+                merged_scv[station] += flow_rate / arrival_rate[station] * flow_scv
+        station_arrival_scv = merged_scv
+
+    # Queue length, waiting and sojourn time of each station
+    station_results = dict()
+    for station in stations:
+        queue_length = erlang_c_queue_length(arrival_rate[station], processing_time, capacities[station])
+        queue_length *= (station_arrival_scv[station] + processing_scv) / 2
+        waiting_time = queue_length / arrival_rate[station]
+        station_results[station] = {'arrival_rate': arrival_rate[station],
+                                    'utilization': utilization[station],
+                                    'overloaded': utilization[station] >= 1,
+                                    'arrival_scv': station_arrival_scv[station],
+                                    'queue_length': queue_length,
+                                    'waiting_time': waiting_time,
+                                    'sojourn_time': waiting_time + processing_time,
+                                    }
+
+    sftt_results = dict()
+    for product_type, product_stations in routing.items():
+        sojourn_times = [station_results[station]['sojourn_time'] for station in product_stations]
+        sftt_results[product_type] = sftt_distribution(sojourn_times)
+
+    return {'stations': station_results, 'sftt': sftt_results}
+
+
+def compare_with_simulation(approximation, order_tracking_df, tolerance=0.2):
+    """
+    Compares the approximated mean SFTT of each product type with the simulated SFTT of the finished orders
+    (order_tracking_df of third_article_features.py) and flags the product types, where the approximation is
+    inaccurate.
+    :param approximation: The result of approximate_shop().
+    :param order_tracking_df: DataFrame with the columns product_type and sftt of the finished orders.
+    :param tolerance: Maximum relative deviation of the mean SFTT, which is still accurate.
+    :return: Returns a DataFrame with the approximated and simulated SFTT per product type.
+    """
+    import pandas as pd
+
+    rows = []
+    for product_type, distribution in approximation['sftt'].items():
+        simulated = order_tracking_df['sftt'].loc[order_tracking_df['product_type'] == product_type]
+        simulated_mean = simulated.mean() if len(simulated) > 0 else math.nan
+        relative_error = (distribution['mean'] - simulated_mean) / simulated_mean
+        rows.append({'product_type': product_type,
+                     'approximated_mean': distribution['mean'],
+                     'simulated_mean': simulated_mean,
+                     'approximated_p90': distribution['p90'],
+                     'simulated_p90': simulated.quantile(0.9) if len(simulated) > 0 else math.nan,
+                     'relative_error': relative_error,
+                     'inaccurate': not abs(relative_error) <= tolerance,
+                     })
+
+    return pd.DataFrame(rows).set_index('product_type')
+
+
+if __name__ == '__main__':
+    from third_article_features import routing, new_order_time, period_length, processing_time_mean
+
+    # The model releases the orders in batches at the start of each period with exponential processing times. The
+    # batches are approximated by renewal arrivals with the same SCV, so the SFTT is less accurate for long periods.
+    result = approximate_shop(routing, new_order_time=new_order_time, processing_time=processing_time_mean,
+                              arrival_scv=batch_release_scv(period_length, new_order_time), processing_scv=1.0)
+    for station_number, station_result in result['stations'].items():
+        if station_result['overloaded']:
+            print(f"###Station {station_number}: Utilization {station_result['utilization']:.2f}, the station is "
+                  f"overloaded and its queue grows without limit.")
+        else:
+            print(f"###Station {station_number}: Utilization {station_result['utilization']:.2f}, "
+                  f"queue length {station_result['queue_length']:.2f}.")
+    for product_type, distribution in result['sftt'].items():
+        if math.isinf(distribution['mean']):
+            print(f"###Product type {product_type}: No steady state SFTT, its routing passes an overloaded station.")
+        else:
+            print(f"###Product type {product_type}: Mean SFTT {distribution['mean']:.1f}, "
+                  f"p90 {distribution['p90']:.1f}.")
@@ -0,0 +1,138 @@
+# Imports
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import math
+import numpy as np
+
+
+def parameter_grid(**parameters):
+    """
+    Creates all combinations of the given release parameters.
+    :param parameters: The values of each parameter, e.g. expected_processing_time=[80, 100, 120].
+    :return: Returns a list of configurations (dicts of parameter values).
+    """
+    names = list(parameters.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*parameters.values())]
+
+
+def evaluate_configuration(configuration, seed, sim_time):
+    """
+    Runs one replication of the third article's model with the given release parameters.
+    :param configuration: Dict of model parameters (expected_processing_time, period_length, release_slack, ...).
+    :param seed: The seed of the replication. The same seeds are used for all configurations.
+    :param sim_time: The simulation run time.
+    :return: Returns the mean earliness plus tardiness of the finished orders.
+    """
+    import third_article_features as model
+
+    for name in configuration.keys():
+        if not hasattr(model, name):
+            raise ValueError(f"The model has no parameter {name}.")
+
+    # The worker processes are reused, so the changed parameters are restored after the replication
+    parameters = dict(configuration, verbose=False, collect_dataframes=False)
+    original_parameters = {name: getattr(model, name) for name in parameters.keys()}
+    try:
+        for name, value in parameters.items():
+            setattr(model, name, value)
+        model.run_simulation(sim_time, seed=seed)
+    finally:
+        for name, value in original_parameters.items():
+            setattr(model, name, value)
+
+    if model.finished_orders == 0:
+        return math.inf
+    return (model.earliness_statistics.total + model.tardiness_statistics.total) / model.finished_orders
+
+
+def ocba_allocation(means, variances, total_budget):
+    """
+    Calculates the number of replications of each configuration with the Optimal Computing Budget Allocation
+    (OCBA), so that the probability to select the configuration with the lowest mean is maximised.
+    :param means: Sample mean of each configuration.
+    :param variances: Sample variance of each configuration.
+    :param total_budget: Total number of replications of all configurations.
+    :return: Returns the number of replications of each configuration.
+    """
+    means = np.asarray(means, dtype=float)
+    std = np.sqrt(np.maximum(np.asarray(variances, dtype=float), 1e-12))
+    best = int(np.argmin(means))
+
+    # Ratios of the non-best configurations, relative to their distance to the best
+    distance = np.maximum(np.abs(means - means[best]), 1e-9)
+    ratios = (std / distance) ** 2
+    ratios[best] = 0
+    ratios[best] = std[best] * math.sqrt(np.sum(ratios ** 2 / std ** 2))
+
+    return np.floor(ratios / ratios.sum() * total_budget).astype(int)
+
+
+def optimise_release_parameters(configurations, sim_time, initial_replications=3, budget=60, increment=10,
+                                max_workers=None):
+    """
+    Selects the configuration of release parameters with the lowest mean earliness plus tardiness. After some initial
+    replications of each configuration, the following replications are allocated with OCBA to the configurations,
+    which are most likely the best. The replications run in parallel worker processes.
+    :param configurations: List of configurations (e.g. created by parameter_grid()).
+    :param sim_time: The simulation run time of each replication.
+    :param initial_replications: Number of replications of each configuration in the first step (at least 2, for
+    the variances of OCBA).
+    :param budget: Total number of replications of all configurations.
+    :param increment: Number of replications allocated in each step.
+    :param max_workers: Number of worker processes (None uses all CPUs).
+    :return: Returns the best configuration and a list with the results (mean, variance, replications) of all
+    configurations.
+    """
+    if initial_replications < 2:
+        raise ValueError("At least 2 initial replications are needed to estimate the variances.")
+
+    results = [[] for _ in configurations]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Replications to run: (configuration index, replication number)
+        runs = [(index, replication) for index in range(len(configurations))
+                for replication in range(initial_replications)]
+
+        while runs:
+            futures = [executor.submit(evaluate_configuration, configurations[index], replication, sim_time)
+                       for index, replication in runs]
+            for (index, replication), future in zip(runs, futures):
+                results[index].append(future.result())
+
+            used_budget = sum(len(result) for result in results)
+            if used_budget >= budget:
+                break
+
+            # Allocate the next replications with OCBA
+            means = [np.mean(result) for result in results]
+            variances = [np.var(result, ddof=1) for result in results]
+            target = ocba_allocation(means, variances, min(used_budget + increment, budget))
+            runs = [(index, replication) for index in range(len(configurations))
+                    for replication in range(len(results[index]), target[index])]
+
+            # Without any new replication, the most promising configuration gets the remaining increment
+            if not runs:
+                best = int(np.argmin(means))
+                runs = [(best, replication) for replication in
+                        range(len(results[best]), len(results[best]) + min(increment, budget - used_budget))]
+
+    summary = [{'configuration': configuration,
+                'mean': float(np.mean(result)),
+                'variance': float(np.var(result, ddof=1)),
+                'replications': len(result),
+                } for configuration, result in zip(configurations, results)]
+    best = min(summary, key=lambda x: x['mean'])
+
+    return best['configuration'], summary
+
+
+if __name__ == '__main__':
+    candidates = parameter_grid(expected_processing_time=[100, 300, 500],
+                                period_length=[720, 1440],
+                                release_slack=[0, 1440])
+    best_configuration, configuration_results = optimise_release_parameters(candidates, sim_time=100000)
+
+    for configuration_result in configuration_results:
+        print(f"###{configuration_result['configuration']}: Mean earliness + tardiness "
+              f"{configuration_result['mean']:.1f} ({configuration_result['replications']} replications).")
+    print(f"###Best configuration: {best_configuration}")
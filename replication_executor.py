@@ -0,0 +1,392 @@
+# Imports
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+# Model parameters, which are given by the name of a model function or list
+model_objects = ('release_function', 'sequencing_function', 'release_pool')
+
+# Version of the result dicts, part of the scenario key. Increase it, if the results change their meaning, so stored
+# results of the old version are not mixed with new ones (2: tardiness_sum is positive).
+result_version = 2
+
+
+def scenario_key(scenario):
+    """
+    Creates the key of a scenario, under which its results are stored.
+    :param scenario: Dict with the name, the model parameters and the sim_time of the scenario.
+    :return: Returns the scenario and the result_version as canonical JSON string.
+    """
+    return json.dumps(dict(scenario, result_version=result_version), sort_keys=True)
+
+
+def run_scenario_replication(scenario, seed):
+    """
+    Runs one replication of a scenario of the third article's model.
+    :param scenario: Dict with the name, the model parameters (e.g. {'release_function': 'ir', 'release_pool':
+    'order_pool', 'sequencing_function': 'edd'}) and the sim_time of the scenario.
+    :param seed: The seed of the replication.
+    :return: Returns a dict with the numbers of created, finished, early and tardy orders, the summed earliness and
+    tardiness (positive) and the summaries of the SFTT, earliness and tardiness (see performance_summary()).
+    """
+    import third_article_features as model
+
+    # The worker processes are reused, so the changed parameters are restored after the replication
+    parameters = {'verbose': False, 'collect_dataframes': False}
+    for name, value in scenario.get('parameters', dict()).items():
+        if not hasattr(model, name):
+            raise ValueError(f"The model has no parameter {name}.")
+        parameters[name] = getattr(model, value) if name in model_objects else value
+
+    original_parameters = {name: getattr(model, name) for name in parameters.keys()}
+    try:
+        for name, value in parameters.items():
+            setattr(model, name, value)
+        model.run_simulation(scenario['sim_time'], seed=seed)
+    finally:
+        for name, value in original_parameters.items():
+            setattr(model, name, value)
+
+    return {'created_orders': model.order_number,
+            'finished_orders': model.finished_orders,
+            'early_orders': model.early_orders,
+            'tardy_orders': model.tardy_orders,
+            'earliness_sum': float(model.earliness_statistics.total),
+            'tardiness_sum': float(model.tardiness_statistics.total),
+            'summaries': {name: summary.to_dict() for name, summary in model.performance_summary().items()},
+            }
+
+
+class ResultStore:
+    """
+    This class stores the results of the replications in a local SQLite file. Results are only appended and every
+    (scenario, seed) is stored once, so finished replications are never recomputed.
+    """
+
+    def __init__(self, path):
+        """
+        Here the variables for the store are defined.
+        :param path: Path of the SQLite file.
+        """
+        self.path = path
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results (scenario TEXT NOT NULL, seed INTEGER NOT NULL, '
+                               'result TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (scenario, seed))')
+
+    def connect(self):
+        """
+        Opens a connection to the SQLite file, which waits for concurrent writers.
+        :return: Returns the connection.
+        """
+        return sqlite3.connect(self.path, timeout=60)
+
+    def add(self, scenario, seed, result):
+        """
+        Stores the result of a replication, if it was not stored before.
+        :param scenario: The scenario of the replication.
+        :param seed: The seed of the replication.
+        :param result: The result dict of the replication.
+        """
+        with self.connect() as connection:
+            connection.execute('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)',
+                               (scenario_key(scenario), seed, json.dumps(result), time.time()))
+
+    def is_finished(self, scenario, seed):
+        """
+        Checks, whether the result of a replication is stored.
+        :param scenario: The scenario of the replication.
+        :param seed: The seed of the replication.
+        :return: Returns True, if the result is stored.
+        """
+        with self.connect() as connection:
+            return connection.execute('SELECT 1 FROM results WHERE scenario = ? AND seed = ?',
+                                      (scenario_key(scenario), seed)).fetchone() is not None
+
+    def finished(self):
+        """
+        Collects the (scenario key, seed) of all stored replications.
+        :return: Returns a set of (scenario key, seed).
+        """
+        with self.connect() as connection:
+            return set(connection.execute('SELECT scenario, seed FROM results'))
+
+    def results(self, scenario):
+        """
+        Loads the stored results of a scenario.
+        :param scenario: The scenario.
+        :return: Returns a dict of seed and result dict.
+        """
+        with self.connect() as connection:
+            rows = connection.execute('SELECT seed, result FROM results WHERE scenario = ? ORDER BY seed',
+                                      (scenario_key(scenario),))
+            return {seed: json.loads(result) for seed, result in rows}
+
+
+class LocalBackend:
+    """
+    This class runs the replications in a local pool of worker processes. The results are stored by the calling
+    process.
+    """
+
+    def __init__(self, max_workers=None, max_retries=2):
+        """
+        Here the variables for the backend are defined.
+        :param max_workers: Number of worker processes (None uses all CPUs).
+        :param max_retries: How often a failed replication is retried.
+        """
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+
+    def run(self, tasks, store):
+        """
+        Runs the replications and stores their results.
+        :param tasks: List of (scenario, seed).
+        :param store: The ResultStore.
+        :return: Returns the list of (scenario, seed), which failed in every attempt.
+        """
+        for _ in range(self.max_retries + 1):
+            failed = []
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(run_scenario_replication, scenario, seed) for scenario, seed in tasks]
+                for (scenario, seed), future in zip(tasks, futures):
+                    try:
+                        store.add(scenario, seed, future.result())
+                    except Exception:
+                        failed.append((scenario, seed))
+            if not failed:
+                break
+            tasks = failed
+
+        return failed
+
+
+class FileQueueBackend:
+    """
+    This class dispatches the replications through a queue directory, e.g. on a shared filesystem. Every task is a
+    JSON file in pending/, which a worker claims by moving it to claimed/. Workers on this or other machines run
+    run_worker() (python replication_executor.py worker <queue_dir> <store_path>) and store the results directly.
+    Claims of crashed workers are put back to pending/ after the lease timeout.
+    """
+
+    def __init__(self, queue_dir, nb_local_workers=2, max_retries=2, lease_timeout=3600, poll_interval=1.0,
+                 max_worker_restarts=5):
+        """
+        Here the variables for the backend are defined.
+        :param queue_dir: The queue directory.
+        :param nb_local_workers: Number of worker processes started on this machine (0 waits for external workers).
+        :param max_retries: How often a failed replication is retried.
+        :param lease_timeout: Seconds after which a claimed task is put back to pending/. Running workers renew the
+        lease of their task every lease_timeout / 3 seconds.
+        :param poll_interval: Seconds between two checks of the queue.
+        :param max_worker_restarts: How often crashed local workers are restarted, before the run is stopped.
+        """
+        self.queue_dir = queue_dir
+        self.nb_local_workers = nb_local_workers
+        self.max_retries = max_retries
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.max_worker_restarts = max_worker_restarts
+        for folder in ('pending', 'claimed', 'failed'):
+            os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    def enqueue(self, scenario, seed):
+        """
+        Writes a task file into pending/. The file is renamed into place, so workers never read half-written tasks.
+        :param scenario: The scenario of the replication.
+        :param seed: The seed of the replication.
+        """
+        task = {'scenario': scenario, 'seed': seed, 'attempts': 0, 'max_retries': self.max_retries}
+        name = f"{hashlib.sha1(scenario_key(scenario).encode()).hexdigest()[:16]}_{seed}.json"
+        temporary = os.path.join(self.queue_dir, f".{name}.tmp")
+        with open(temporary, 'w') as task_file:
+            json.dump(task, task_file)
+        os.replace(temporary, os.path.join(self.queue_dir, 'pending', name))
+
+        # A new attempt replaces the record of an earlier failure
+        if os.path.exists(os.path.join(self.queue_dir, 'failed', name)):
+            os.remove(os.path.join(self.queue_dir, 'failed', name))
+
+    def run(self, tasks, store):
+        """
+        Enqueues the replications, starts the local workers and waits until the queue is empty.
+        :param tasks: List of (scenario, seed).
+        :param store: The ResultStore.
+        :return: Returns the list of (scenario, seed), which failed in every attempt.
+        """
+        for scenario, seed in tasks:
+            self.enqueue(scenario, seed)
+
+        context = multiprocessing.get_context('spawn')
+        workers = []
+        local_worker_ids = set()  # Prefixes of the claims of the local workers (see run_worker())
+        nb_crashes = 0
+        while True:
+            requeue_stale_claims(self.queue_dir, self.lease_timeout)
+            pending = os.listdir(os.path.join(self.queue_dir, 'pending'))
+            claimed = os.listdir(os.path.join(self.queue_dir, 'claimed'))
+
+            # Workers exit with 0, if no task is pending, otherwise they crashed
+            for worker in workers:
+                if not worker.is_alive() and worker.exitcode != 0:
+                    nb_crashes += 1
+                    if nb_crashes > self.max_worker_restarts:
+                        for other_worker in workers:
+                            other_worker.terminate()
+                        raise RuntimeError(f"Local workers crashed {nb_crashes} times, the last one with exit code "
+                                           f"{worker.exitcode}. The tasks are kept in {self.queue_dir}.")
+            workers = [worker for worker in workers if worker.is_alive()]
+
+            if pending and len(workers) < self.nb_local_workers:
+                # Start (or restart crashed) local workers
+                for _ in range(self.nb_local_workers - len(workers)):
+                    worker = context.Process(target=run_worker, args=(self.queue_dir, store.path, self.lease_timeout))
+                    worker.start()
+                    workers.append(worker)
+                    local_worker_ids.add(f"{socket.gethostname()}-{worker.pid}")
+            elif not pending and not claimed:
+                break
+            elif not pending and not workers and self.nb_local_workers > 0:
+                # Claims of crashed local workers are retried immediately, claims of external workers keep their lease
+                requeue_stale_claims(self.queue_dir, 0, local_worker_ids)
+
+            time.sleep(self.poll_interval)
+
+        for worker in workers:
+            worker.join()
+
+        failed = []
+        for name in os.listdir(os.path.join(self.queue_dir, 'failed')):
+            with open(os.path.join(self.queue_dir, 'failed', name)) as task_file:
+                task = json.load(task_file)
+            failed.append((task['scenario'], task['seed']))
+
+        return failed
+
+
+def requeue_stale_claims(queue_dir, lease_timeout, worker_ids=None):
+    """
+    Puts claimed tasks back to pending/, if their claim is older than the lease timeout.
+    :param queue_dir: The queue directory.
+    :param lease_timeout: Seconds after which a claim is stale.
+    :param worker_ids: Only the claims of these workers ("<host>-<pid>") are checked (None checks all claims).
+    """
+    claimed_dir = os.path.join(queue_dir, 'claimed')
+    for name in os.listdir(claimed_dir):
+        path = os.path.join(claimed_dir, name)
+        if worker_ids is not None and name.split('__', 1)[0] not in worker_ids:
+            continue
+        try:
+            if time.time() - os.path.getmtime(path) >= lease_timeout:
+                # Remove the worker prefix of the claimed file
+                os.rename(path, os.path.join(queue_dir, 'pending', name.split('__', 1)[1]))
+        except (FileNotFoundError, IndexError):
+            pass
+
+
+def renew_lease(claimed_path, lease_timeout, done):
+    """
+    Renews the lease of a claimed task by updating the modification time of its file every lease_timeout / 3 seconds,
+    until the task is done or the file is gone.
+    :param claimed_path: Path of the claimed task file.
+    :param lease_timeout: Seconds after which a claim is stale.
+    :param done: threading.Event, which is set when the task is done.
+    """
+    while not done.wait(lease_timeout / 3):
+        try:
+            os.utime(claimed_path)
+        except FileNotFoundError:
+            return
+
+
+def run_worker(queue_dir, store_path, lease_timeout=3600):
+    """
+    Claims and runs tasks of the queue directory until no task is pending. If the claim of a task was put back to
+    pending/ (lost lease), the task is left to the next worker.
+    :param queue_dir: The queue directory.
+    :param store_path: Path of the SQLite file of the ResultStore.
+    :param lease_timeout: Seconds after which claims of crashed workers are put back to pending/.
+    """
+    store = ResultStore(store_path)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    pending_dir = os.path.join(queue_dir, 'pending')
+
+    while True:
+        requeue_stale_claims(queue_dir, lease_timeout)
+        names = sorted(os.listdir(pending_dir))
+        if not names:
+            break
+
+        for name in names:
+            claimed_path = os.path.join(queue_dir, 'claimed', f"{worker_id}__{name}")
+            try:
+                # Only one worker can move the file, the others get a FileNotFoundError
+                os.rename(os.path.join(pending_dir, name), claimed_path)
+                # The rename keeps the modification time, the lease starts now
+                os.utime(claimed_path)
+                with open(claimed_path) as task_file:
+                    task = json.load(task_file)
+            except FileNotFoundError:
+                continue
+
+            done = threading.Event()
+            threading.Thread(target=renew_lease, args=(claimed_path, lease_timeout, done), daemon=True).start()
+            try:
+                if not store.is_finished(task['scenario'], task['seed']):
+                    store.add(task['scenario'], task['seed'], run_scenario_replication(task['scenario'], task['seed']))
+                error = None
+            except Exception:
+                error = traceback.format_exc()
+            finally:
+                done.set()
+
+            try:
+                if error is None:
+                    os.remove(claimed_path)
+                else:
+                    task['attempts'] += 1
+                    task['error'] = error
+                    folder = 'pending' if task['attempts'] <= task['max_retries'] else 'failed'
+                    with open(claimed_path, 'r+') as task_file:
+                        json.dump(task, task_file)
+                        task_file.truncate()
+                    os.rename(claimed_path, os.path.join(queue_dir, folder, name))
+            except FileNotFoundError:
+                # Lost lease: the task was put back to pending/ and is handled by the next worker
+                pass
+            break
+
+
+def run_replications(scenarios, seeds, store, backend=None):
+    """
+    Runs all replications of the scenarios, which are not stored yet, and loads the results of all replications.
+    :param scenarios: List of scenarios (dicts with the name, the model parameters and the sim_time).
+    :param seeds: The seeds of the replications of each scenario.
+    :param store: The ResultStore.
+    :param backend: LocalBackend or FileQueueBackend (None uses a LocalBackend).
+    :return: Returns a dict of scenario name and its dict of seed and result, and the failed (scenario, seed).
+    """
+    if backend is None:
+        backend = LocalBackend()
+
+    finished = store.finished()
+    tasks = [(scenario, seed) for scenario in scenarios for seed in seeds
+             if (scenario_key(scenario), seed) not in finished]
+    failed = backend.run(tasks, store) if tasks else []
+
+    return {scenario['name']: store.results(scenario) for scenario in scenarios}, failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 4 and sys.argv[1] == 'worker':
+        run_worker(sys.argv[2], sys.argv[3])
+    else:
+        print("Usage: python replication_executor.py worker <queue_dir> <store_path>")
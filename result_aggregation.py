@@ -0,0 +1,198 @@
+# Imports
+import json
+import math
+import os
+from replication_executor import scenario_key
+from streaming_statistics import MetricSummary
+
+# Metrics summarised per replication (see performance_summary() of third_article_features.py)
+metric_names = ('sftt', 'earliness', 'tardiness')
+
+# Order counters summed over the replications
+counter_names = ('created_orders', 'finished_orders', 'early_orders', 'tardy_orders')
+
+
+class ScenarioAggregate:
+    """
+    This class merges the results of the replications of a scenario. Per metric it keeps the MetricSummary of all
+    orders and a MetricSummary of the replication means (for confidence intervals), but no single values. The
+    aggregate belongs to the scenario key (name, model parameters and sim_time), the name is only its label.
+    """
+
+    def __init__(self, key, name):
+        """
+        Here the variables for the aggregate are defined.
+        :param key: The key of the scenario (see scenario_key() of replication_executor.py).
+        :param name: The name of the scenario, e.g. 'IR_EDD'.
+        """
+        self.key = key
+        self.name = name
+        self.seeds = set()
+        self.counters = {counter: 0 for counter in counter_names}
+        self.metrics = {metric: MetricSummary() for metric in metric_names}
+        self.replication_means = {metric: MetricSummary() for metric in metric_names}
+
+    def add_replication(self, seed, result):
+        """
+        Merges the result of a replication, if it was not merged before.
+        :param seed: The seed of the replication.
+        :param result: The result dict of the replication (see run_scenario_replication() of replication_executor.py).
+        :return: Returns True, if the replication was merged.
+        """
+        if seed in self.seeds or 'summaries' not in result.keys():
+            return False
+
+        self.seeds.add(seed)
+        for counter in counter_names:
+            self.counters[counter] += result[counter]
+        for metric in metric_names:
+            summary = MetricSummary.from_dict(result['summaries'][metric])
+            self.metrics[metric].merge(summary)
+            if summary.count > 0:
+                self.replication_means[metric].add(summary.mean)
+
+        return True
+
+    def confidence_half_width(self, metric, z=1.96):
+        """
+        Calculates the half width of the confidence interval of the metric's mean from the replication means.
+        :param metric: The metric name.
+        :param z: The quantile of the normal distribution (1.96 for 95 %).
+        :return: Returns the half width (nan for less than two replications).
+        """
+        replication_means = self.replication_means[metric]
+        if replication_means.count < 2:
+            return math.nan
+
+        return z * replication_means.std / math.sqrt(replication_means.count)
+
+    def to_dict(self):
+        """
+        Converts the aggregate into a JSON serializable dict.
+        :return: Returns the dict.
+        """
+        return {'key': self.key,
+                'name': self.name,
+                'seeds': sorted(self.seeds),
+                'counters': self.counters,
+                'metrics': {metric: summary.to_dict() for metric, summary in self.metrics.items()},
+                'replication_means': {metric: summary.to_dict() for metric, summary in self.replication_means.items()},
+                }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates an aggregate from a dict of to_dict().
+        :param data: The dict.
+        :return: Returns the ScenarioAggregate.
+        """
+        aggregate = cls(data['key'], data['name'])
+        aggregate.seeds = set(data['seeds'])
+        aggregate.counters = data['counters']
+        aggregate.metrics = {metric: MetricSummary.from_dict(summary) for metric, summary in data['metrics'].items()}
+        aggregate.replication_means = {metric: MetricSummary.from_dict(summary)
+                                       for metric, summary in data['replication_means'].items()}
+
+        return aggregate
+
+
+class AggregationCache:
+    """
+    This class stores the ScenarioAggregates in a JSON file, keyed by the scenario key. When it is updated, only the
+    replications which were not merged before are read and merged. Scenarios with the same name, but other model
+    parameters or sim_time, get their own aggregates.
+    """
+
+    def __init__(self, path):
+        """
+        Here the variables for the cache are defined.
+        :param path: Path of the JSON file.
+        """
+        self.path = path
+        self.aggregates = dict()
+
+        if os.path.exists(path):
+            with open(path) as cache_file:
+                self.aggregates = {key: ScenarioAggregate.from_dict(data) for key, data in json.load(cache_file).items()
+                                   if 'key' in data.keys()}
+
+    def aggregate(self, scenario):
+        """
+        Gets the aggregate of a scenario and creates it, if the scenario is new.
+        :param scenario: Dict with the name, the model parameters and the sim_time of the scenario.
+        :return: Returns the ScenarioAggregate.
+        """
+        key = scenario_key(scenario)
+        if key not in self.aggregates.keys():
+            self.aggregates[key] = ScenarioAggregate(key, scenario['name'])
+
+        return self.aggregates[key]
+
+    def update(self, scenario, results):
+        """
+        Merges the new replications of a scenario.
+        :param scenario: Dict with the name, the model parameters and the sim_time of the scenario.
+        :param results: Dict of seed and result dict of the replications.
+        :return: Returns the number of newly merged replications.
+        """
+        aggregate = self.aggregate(scenario)
+        return sum(aggregate.add_replication(seed, result) for seed, result in results.items()
+                   if seed not in aggregate.seeds)
+
+    def update_from_store(self, store, scenarios):
+        """
+        Merges the new replications of the scenarios from the ResultStore of replication_executor.py and saves the
+        cache.
+        :param store: The ResultStore.
+        :param scenarios: List of scenarios (dicts with the name, the model parameters and the sim_time).
+        :return: Returns the number of newly merged replications.
+        """
+        nb_merged = sum(self.update(scenario, store.results(scenario)) for scenario in scenarios)
+        if nb_merged > 0:
+            self.save()
+
+        return nb_merged
+
+    def scenario_aggregates(self, scenarios):
+        """
+        Selects the aggregates of the scenarios, e.g. for comparison_table().
+        :param scenarios: List of scenarios (dicts with the name, the model parameters and the sim_time).
+        :return: Returns a dict of scenario name and ScenarioAggregate.
+        """
+        return {scenario['name']: self.aggregate(scenario) for scenario in scenarios}
+
+    def save(self):
+        """
+        Writes the cache into its JSON file.
+        """
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as cache_file:
+            json.dump({key: aggregate.to_dict() for key, aggregate in self.aggregates.items()}, cache_file)
+        os.replace(temporary, self.path)
+
+
+def comparison_table(aggregates, metrics=metric_names, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Compares the scenarios (e.g. IR_EDD vs BIL_PRD) by their order counters and the mean, confidence interval and
+    quantiles of each metric.
+    :param aggregates: Dict of scenario name and ScenarioAggregate (e.g. AggregationCache.scenario_aggregates()).
+    :param metrics: The metrics to compare.
+    :param quantiles: The quantiles to compare.
+    :return: Returns a DataFrame with one row per scenario.
+    """
+    import pandas as pd
+
+    rows = []
+    for name, aggregate in aggregates.items():
+        row = {'scenario': name, 'replications': len(aggregate.seeds)}
+        row.update(aggregate.counters)
+        for metric in metrics:
+            summary = aggregate.metrics[metric]
+            row[f'{metric}_mean'] = summary.mean
+            row[f'{metric}_ci'] = aggregate.confidence_half_width(metric)
+            row[f'{metric}_std'] = summary.std
+            for quantile in quantiles:
+                row[f'{metric}_p{round(quantile * 100)}'] = summary.quantile(quantile)
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index('scenario')
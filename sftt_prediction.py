@@ -0,0 +1,184 @@
+# Imports
+import pickle
+import time
+import numpy as np
+from feature_pipeline import feature_schema, feature_dtype
+
+# Width of the buckets of each feature in the cache key, every feature the model uses is part of the key
+cache_buckets = {'product_type': 1,
+                 'wip': 5,
+                 'nb_order_queue_routing': 2,
+                 'last_sftt': 60,
+                 'last_5_sftt_mean': 60,
+                 'last_5_sftt_median': 60,
+                 'last_50_sftt_mean': 60,
+                 'last_50_sftt_median': 60,
+                 'nb_operations': 1,
+                 'due_date_slack': 60,
+                 'order_pool_size': 5,
+                 }
+
+
+class LinearSFTTModel:
+    """
+    This class contains a linear regression of the SFTT on the features. It can be stored in and loaded from a
+    .npz file without any further dependency.
+    """
+
+    def __init__(self, coefficients, intercept):
+        """
+        Here the variables for the model are defined.
+        :param coefficients: One coefficient per feature column.
+        :param intercept: The intercept of the regression.
+        """
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.intercept = float(intercept)
+
+    def predict(self, X):
+        """
+        Predicts the SFTT of all rows of X at once.
+        :param X: Feature matrix.
+        :return: Returns the predicted SFTT per row.
+        """
+        return np.asarray(X, dtype=np.float64) @ self.coefficients + self.intercept
+
+    def save(self, path):
+        """
+        Stores the model in a .npz file.
+        :param path: Path of the .npz file.
+        """
+        np.savez(path, coefficients=self.coefficients, intercept=self.intercept)
+
+
+def fit_linear_model(X, y):
+    """
+    Fits a LinearSFTTModel with least squares.
+    :param X: Feature matrix.
+    :param y: SFTT of each row.
+    :return: Returns the fitted LinearSFTTModel.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    design = np.column_stack([X, np.ones(len(X))])
+    solution = np.linalg.lstsq(design, np.asarray(y, dtype=np.float64), rcond=None)[0]
+
+    return LinearSFTTModel(solution[:-1], solution[-1])
+
+
+def load_prediction_model(path):
+    """
+    Loads a trained SFTT model from a local file. .npz files contain a LinearSFTTModel, .joblib files are loaded
+    with joblib (e.g. sklearn models) and all other files are unpickled. Every model needs a predict(X) method.
+    :param path: Path of the model file.
+    :return: Returns the loaded model.
+    """
+    path = str(path)
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return LinearSFTTModel(data['coefficients'], data['intercept'])
+    if path.endswith('.joblib'):
+        import joblib
+
+        return joblib.load(path)
+    with open(path, 'rb') as model_file:
+        return pickle.load(model_file)
+
+
+class PredictionService:
+    """
+    In this class the orders waiting for their SFTT prediction are collected. Once per period all of them are
+    predicted with one vectorized predict() call. Predictions are cached per bucket of all feature columns of the
+    model (see cache_buckets), so that only orders with new buckets are passed to the model. Orders predicted in a
+    batch always get their own prediction, the cached ones the prediction of the first order in their bucket.
+    """
+
+    def __init__(self, model, feature_columns=feature_schema, bucket_widths=cache_buckets, max_cache_size=10000):
+        """
+        Here the variables for the service are defined.
+        :param model: Trained model with a predict(X) method.
+        :param feature_columns: The columns of feature_schema the model was trained on.
+        :param bucket_widths: Dict of the bucket width of each feature column (None disables the cache).
+        :param max_cache_size: Number of cached predictions, after which the cache is cleared.
+        """
+        self.model = model
+        self.feature_columns = feature_columns
+        self.column_index = [feature_schema.index(column) for column in feature_columns]
+        self.bucket_widths = bucket_widths
+        if bucket_widths is not None:
+            self.widths = np.asarray([bucket_widths[column] for column in feature_columns], dtype=feature_dtype)
+        self.max_cache_size = max_cache_size
+        self.cache = dict()
+        self.pending_orders = []
+        self.pending_features = []
+        self.overhead = []  # Inference overhead of each period
+
+    @classmethod
+    def from_file(cls, path, feature_columns=feature_schema, bucket_widths=cache_buckets, max_cache_size=10000):
+        """
+        Creates the service for a model stored in a local file.
+        :param path: Path of the model file (see load_prediction_model()).
+        :param feature_columns: The columns of feature_schema the model was trained on.
+        :param bucket_widths: Dict of the bucket width of each feature column (None disables the cache).
+        :param max_cache_size: Number of cached predictions, after which the cache is cleared.
+        :return: Returns the PredictionService.
+        """
+        return cls(load_prediction_model(path), feature_columns, bucket_widths, max_cache_size)
+
+    def reset(self):
+        """
+        Clears the cache, the waiting orders and the overhead before a new run.
+        """
+        self.cache = dict()
+        self.pending_orders = []
+        self.pending_features = []
+        self.overhead = []
+
+    def add_order(self, order, features):
+        """
+        Adds a new order to the orders waiting for the next batch prediction.
+        :param order: The new order.
+        :param features: The orders' features in the order of feature_schema.
+        """
+        self.pending_orders.append(order)
+        self.pending_features.append(features)
+
+    def predict_pending(self, period):
+        """
+        Predicts the SFTT of all waiting orders with one predict() call and measures the inference overhead.
+        :param period: The current period, stored with the overhead.
+        :return: Returns a list of (order, predicted sftt).
+        """
+        if not self.pending_orders:
+            return []
+
+        start = time.perf_counter()
+        X = np.asarray(self.pending_features, dtype=feature_dtype)[:, self.column_index]
+        sftt = np.empty(len(X))
+
+        if self.bucket_widths is not None:
+            keys = [tuple(bucket) for bucket in np.floor(X / self.widths).astype(int)]
+
+            missing = [row for row, key in enumerate(keys) if key not in self.cache]
+            if len(self.cache) + len(missing) > self.max_cache_size:
+                self.cache = dict()
+                missing = list(range(len(X)))
+            for row, key in enumerate(keys):
+                if key in self.cache.keys():
+                    sftt[row] = self.cache[key]
+            if missing:
+                sftt[missing] = self.model.predict(X[missing])
+                for row in missing:
+                    self.cache.setdefault(keys[row], float(sftt[row]))
+        else:
+            missing = range(len(X))
+            sftt[:] = self.model.predict(X)
+
+        predictions = list(zip(self.pending_orders, sftt))
+        self.overhead.append({'period': period,
+                              'nb_orders': len(X),
+                              'nb_predicted': len(missing),
+                              'seconds': time.perf_counter() - start,
+                              })
+        self.pending_orders = []
+        self.pending_features = []
+
+        return predictions
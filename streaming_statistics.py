@@ -0,0 +1,237 @@
+# Imports
+import math
+
+
+class QuantileSketch:
+    """
+    This class approximates the quantiles of a stream of values with a relative accuracy. Every value is counted in a
+    logarithmic bucket, so the memory only grows with the range of the values and two sketches are merged by adding
+    their bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Here the variables for the sketch are defined.
+        :param relative_accuracy: Maximum relative error of the quantiles.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = dict()  # Bucket index -> count
+        self.negative = dict()
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        """
+        Counts a value in its bucket.
+        :param value: The new value.
+        """
+        self.count += 1
+        if value == 0:
+            self.zero_count += 1
+            return
+
+        buckets = self.positive if value > 0 else self.negative
+        index = math.ceil(math.log(abs(value)) / self.log_gamma)
+        buckets[index] = buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch with the same relative accuracy.
+        :param other: The other QuantileSketch.
+        """
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        Approximates a quantile.
+        :param q: The quantile between 0 and 1.
+        :return: Returns the approximated quantile (nan, if no value was added).
+        """
+        if self.count == 0:
+            return math.nan
+
+        rank = q * (self.count - 1)
+        seen = 0
+        # From the most negative to the largest value
+        for index in sorted(self.negative.keys(), reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -2 * self.gamma ** index / (self.gamma + 1)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive.keys()):
+            seen += self.positive[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.positive.keys()) / (self.gamma + 1)
+
+    def to_dict(self):
+        """
+        Converts the sketch into a JSON serializable dict.
+        :return: Returns the dict.
+        """
+        return {'relative_accuracy': self.relative_accuracy,
+                'positive': {str(index): count for index, count in self.positive.items()},
+                'negative': {str(index): count for index, count in self.negative.items()},
+                'zero_count': self.zero_count,
+                'count': self.count,
+                }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a sketch from a dict of to_dict().
+        :param data: The dict.
+        :return: Returns the QuantileSketch.
+        """
+        sketch = cls(data['relative_accuracy'])
+        sketch.positive = {int(index): count for index, count in data['positive'].items()}
+        sketch.negative = {int(index): count for index, count in data['negative'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+
+        return sketch
+
+
+class MetricSummary:
+    """
+    This class summarises a metric (e.g. the SFTT of the finished orders) by its count, sum, sum of squares, minimum,
+    maximum and a QuantileSketch in constant memory. Summaries of several replications are merged without the single
+    values. Only if keep_values is set, the single values are stored as well and the quantiles are exact.
+    """
+
+    def __init__(self, relative_accuracy=0.01, keep_values=False):
+        """
+        Here the variables for the summary are defined.
+        :param relative_accuracy: Maximum relative error of the quantiles.
+        :param keep_values: Store the single values (raw-data mode).
+        """
+        self.keep_values = keep_values
+        self.values = []
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        """
+        Adds a value to the summary.
+        :param value: The new value.
+        """
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.sketch.add(value)
+        if self.keep_values:
+            self.values.append(value)
+
+    def merge(self, other):
+        """
+        Adds another summary of the same metric.
+        :param other: The other MetricSummary.
+        """
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+        if self.keep_values:
+            if not other.keep_values:
+                # The single values of the other summary are unknown
+                self.keep_values = False
+                self.values = []
+            else:
+                self.values.extend(other.values)
+
+    @property
+    def mean(self):
+        """
+        :return: Returns the mean of the metric.
+        """
+        return self.total / self.count if self.count > 0 else math.nan
+
+    @property
+    def variance(self):
+        """
+        :return: Returns the sample variance of the metric.
+        """
+        if self.count < 2:
+            return math.nan
+        return max(self.total_squares - self.total * self.total / self.count, 0.0) / (self.count - 1)
+
+    @property
+    def std(self):
+        """
+        :return: Returns the sample standard deviation of the metric.
+        """
+        return math.sqrt(self.variance)
+
+    def quantile(self, q):
+        """
+        Approximates a quantile of the metric, clamped to the observed minimum and maximum. In the raw-data mode the
+        quantile is interpolated from the single values.
+        :param q: The quantile between 0 and 1.
+        :return: Returns the quantile.
+        """
+        if self.count == 0:
+            return math.nan
+
+        if self.keep_values:
+            values = sorted(self.values)
+            position = q * (len(values) - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, len(values) - 1)
+            return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+        return min(max(self.sketch.quantile(q), self.minimum), self.maximum)
+
+    def percentiles(self):
+        """
+        :return: Returns a dict with the p50, p90 and p99 of the metric.
+        """
+        return {'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+    def to_dict(self):
+        """
+        Converts the summary into a JSON serializable dict.
+        :return: Returns the dict.
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'total_squares': self.total_squares,
+                'minimum': self.minimum if self.count > 0 else None,
+                'maximum': self.maximum if self.count > 0 else None,
+                'sketch': self.sketch.to_dict(),
+                }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a summary from a dict of to_dict().
+        :param data: The dict.
+        :return: Returns the MetricSummary.
+        """
+        summary = cls()
+        summary.count = data['count']
+        summary.total = data['total']
+        summary.total_squares = data['total_squares']
+        summary.minimum = data['minimum'] if data['minimum'] is not None else math.inf
+        summary.maximum = data['maximum'] if data['maximum'] is not None else -math.inf
+        summary.sketch = QuantileSketch.from_dict(data['sketch'])
+
+        return summary
@@ -1,17 +1,16 @@
 # Imports
 import simpy
-from scipy.stats import expon
 import random
+from collections import deque
 import numpy as np
-import pandas as pd
+from streaming_statistics import MetricSummary
+from trace_replay import load_trace
 
 # Global lists / DataFrames
 stations_list = []
 finished_orders = 0
 early_orders = 0
-earliness_list = []
 tardy_orders = 0
-tardiness_list = []
 
 # Routing of the product types
 routing = {1: [1, 2, 3], 2: [2, 3, 1], 3: [3, 2, 1], 4: [3, 1], 5: [2, 3]}
@@ -22,18 +21,47 @@ order_number = 0
 # Simulation Parameters
 period_length = 1440
 period = 1
+day_length = 1440  # Due dates are 2 to 15 days after the order was created
 new_order_time = 80
+processing_time_mean = 100  # Mean of the exponential processing times at the stations
 SIM_TIME = 1000000
 env = simpy.Environment()
+verbose = True  # Print every order movement
+random_streams = None  # RandomStreams of variance_reduction.py, None draws from random / numpy
+
+# Trace replay (path of a .npy trace created with trace_replay.py, None draws random orders)
+trace_file = None
+trace = None
 
 # Order Pool
 order_pool = []
 order_pool_dict = dict()
 
+# Release planning
+expected_processing_time = 100  # Mean processing time per station used by expected_sftt()
+release_slack = 0  # Additional time the orders are released before their expected SFTT
+
+# Release scheduler
+release_on_starvation = False  # Additionally release, if a station runs out of orders
+starvation_event = None
+
 # Order tracking
 order_tracking_dict = dict()
-order_tracking_df = pd.DataFrame()
-order_features_df = pd.DataFrame()
+order_tracking_df = None  # DataFrames are created with the first finished / created order, if collect_dataframes
+order_features_df = None
+collect_dataframes = True  # Store the tracking and features in the DataFrames for the CSV export (imports pandas)
+recent_sftt = dict()  # The 50 most recently finished sftt per product type
+keep_raw_values = False  # Store every single SFTT, earliness and tardiness in the statistics below
+sftt_statistics = MetricSummary()  # SFTT of all finished orders
+earliness_statistics = MetricSummary()  # Due date - time finished of the early orders
+tardiness_statistics = MetricSummary()  # Time finished - due date of the tardy orders
+feature_buffer = None  # FeatureBuffer of feature_pipeline.py, if the features are collected as NumPy chunks
+
+# Live monitoring (LiveMonitor of live_monitor.py, None runs without monitoring)
+live_monitor = None
+
+# SFTT prediction (PredictionService of sftt_prediction.py, None uses expected_sftt())
+prediction_service = None
 
 
 # Tracking
@@ -86,14 +114,41 @@ def order_track_finished(order_id, product_type, environment, station):
 
             # Calculate SFTT
             time_released = order_tracking_dict[order_id]['time_released']
-            order_tracking_dict[order_id]['sftt'] = environment.now - time_released
+            sftt = environment.now - time_released
+            order_tracking_dict[order_id]['sftt'] = sftt
+
+            # Remember the sftt for the features of the following orders
+            if product_type not in recent_sftt.keys():
+                recent_sftt[product_type] = deque(maxlen=50)
+            recent_sftt[product_type].append(sftt)
+            sftt_statistics.add(sftt)
+
+            if feature_buffer is not None:
+                feature_buffer.add_target(order_id, sftt)
 
             # Store information in ta.order_tracking_df
             new_dict = order_tracking_dict.pop(order_id)
-            new_dict['order_id'] = order_id
-            new_df = pd.DataFrame(new_dict, index=['order_id'])
-            new_df.index.names = ['order_id']
-            order_tracking_df = pd.concat([order_tracking_df, new_df])
+            if collect_dataframes:
+                import pandas as pd
+
+                new_dict['order_id'] = order_id
+                new_df = pd.DataFrame(new_dict, index=['order_id'])
+                new_df.index.names = ['order_id']
+                order_tracking_df = pd.concat([order_tracking_df, new_df])
+
+
+def order_track_processing(order, operation, processing_time):
+    """
+    Tracks the processing time of each operation, so that the run can be replayed as trace.
+    :param order: The processed order.
+    :param operation: The index of the operation on the orders' routing.
+    :param processing_time: The processing time of the operation.
+    :return: Appends the information to the ta.order_tracking_dict.
+    """
+    global order_tracking_dict
+
+    if order.order_id in order_tracking_dict.keys():
+        order_tracking_dict[order.order_id][f'processing_time_{operation + 1}'] = processing_time
 
 
 # Track features
@@ -135,59 +190,83 @@ def last_sftt(product_type):
     :param product_type: The orders' product type.
     :return: Returns the sftt of the most recently finished order of the same product type.
     """
-    global order_tracking_df
-    try:
-        last_sftt_1 = order_tracking_df['sftt'].loc[order_tracking_df['product_type'] == product_type].tail(1).item()
-    except:
-        last_sftt_1 = 0
-    return last_sftt_1
+    global recent_sftt
+
+    if recent_sftt.get(product_type):
+        return recent_sftt[product_type][-1]
+    return 0
 
 
 def last_sftt_5(product_type):
     """
-        Takes the most 5 recently finished sftt of the oder with the same product type.
-        :param product_type: The orders' product type.
-        :return: Returns the mean and median sftt of the 5 most recently finished order of the same product type.
-        """
-    global order_tracking_df
-    try:
-        last_5_sftt = order_tracking_df['sftt'].loc[order_tracking_df['product_type'] == product_type].tail(5)
+    Takes the most 5 recently finished sftt of the oder with the same product type.
+    :param product_type: The orders' product type.
+    :return: Returns the mean and median sftt of the 5 most recently finished order of the same product type.
+    """
+    global recent_sftt
 
-        mean_last_sftt_5 = np.mean(last_5_sftt)
-        median_last_sftt_5 = np.median(last_5_sftt)
+    if recent_sftt.get(product_type):
+        last_5_sftt = list(recent_sftt[product_type])[-5:]
+        return np.mean(last_5_sftt), np.median(last_5_sftt)
+    return 0, 0
 
-    except:
-        mean_last_sftt_5 = 0
-        median_last_sftt_5 = 0
 
-    return mean_last_sftt_5, median_last_sftt_5
+def last_sftt_50(product_type):
+    """
+    Takes the most 50 recently finished sftt of the oder with the same product type.
+    :param product_type: The orders' product type.
+    :return: Returns the mean and median sftt of the 50 most recently finished order of the same product type.
+    """
+    global recent_sftt
+
+    if recent_sftt.get(product_type):
+        last_50_sftt = list(recent_sftt[product_type])
+        return np.mean(last_50_sftt), np.median(last_50_sftt)
+    return 0, 0
 
 
-def last_sftt_50(product_type):
+def order_pool_size():
     """
-        Takes the most 5 recently finished sftt of the oder with the same product type.
-        :param product_type: The orders' product type.
-        :return: Returns the mean and median sftt of the 5 most recently finished order of the same product type.
-        """
-    global order_tracking_df
+    Calculates the number of orders waiting in the order pool for their release.
+    :return: Returns the number of orders in the order pool.
+    """
+    global release_pool
 
-    try:
-        last_50_sftt = order_tracking_df['sftt'].loc[order_tracking_df['product_type'] == product_type].tail(
-            50)
+    if isinstance(release_pool, dict):
+        return sum(len(orders) for orders in release_pool.values())
+    return len(release_pool)
 
-        mean_last_sftt_50 = np.mean(last_50_sftt)
-        median_last_sftt_50 = np.median(last_50_sftt)
-    except:
-        mean_last_sftt_50 = 0
-        median_last_sftt_50 = 0
-    return mean_last_sftt_50, median_last_sftt_50
+
+def current_metrics():
+    """
+    Collects the current state of the run for the live_monitor.
+    :return: Returns a dict with the WIP, the order pool size and the numbers of created, finished, early and
+    tardy orders.
+    """
+    return {'wip': get_wip(),
+            'order_pool_size': order_pool_size(),
+            'created_orders': order_number,
+            'finished_orders': finished_orders,
+            'early_orders': early_orders,
+            'tardy_orders': tardy_orders,
+            }
+
+
+def performance_summary():
+    """
+    Summarises the SFTT, the earliness and the tardiness (positive, time finished after the due date) of the finished
+    orders, e.g. to aggregate several replications with result_aggregation.py.
+    :return: Returns a dict of metric name and MetricSummary.
+    """
+    return {'sftt': sftt_statistics, 'earliness': earliness_statistics, 'tardiness': tardiness_statistics}
 
 
 def collect_features(order):
     """
     This functions calls all the follwing functions to collect the orders features.
     :param order: The new order.
-    :return: Appends the information to the order_features_df
+    :return: Appends the information to the order_features_df and returns the features in the order of
+    feature_schema in feature_pipeline.py.
     """
     global order_features_df
 
@@ -197,6 +276,28 @@ def collect_features(order):
     sftt_5_mean, sftt_5_median = last_sftt_5(order.product_type)
     sftt_50_mean, sftt_50_median = last_sftt_50(order.product_type)
 
+    # Same order as feature_schema in feature_pipeline.py
+    features = (order.product_type,
+                wip,
+                nb_orders_routing_queue,
+                sftt_1,
+                sftt_5_mean,
+                sftt_5_median,
+                sftt_50_mean,
+                sftt_50_median,
+                len(routing.get(order.product_type)),
+                order.due_date - order.env.now,
+                order_pool_size(),
+                )
+
+    if feature_buffer is not None:
+        feature_buffer.add_features(order.order_id, features)
+
+    if not collect_dataframes:
+        return features
+
+    import pandas as pd
+
     new_df = pd.DataFrame({'order_id': order.order_id,
                            'wip': wip,
                            'nb_order_queue_routing': nb_orders_routing_queue,
@@ -209,6 +310,8 @@ def collect_features(order):
 
     order_features_df = pd.concat([order_features_df, new_df])
 
+    return features
+
 
 # Sorting definitions
 def edd(order_pool):
@@ -234,13 +337,32 @@ def expected_sftt(order):
     """
     This function calculates the expected mean SFTT for each order and subtracts it in the second step from
     the orders due date. To do this the number of stations on the orders routing is multiplied by the mean
-    production time of each station (100).
+    production time of each station (expected_processing_time). The release_slack is subtracted as well.
     :param order: The current order.
     """
+    order.prd = order.due_date - (len(routing.get(order.product_type)) * expected_processing_time) - release_slack
+    plan_release(order)
+
+
+def predicted_sftt(predictions):
+    """
+    This function subtracts the SFTT predicted by the prediction_service and the release_slack from the orders
+    due dates.
+    :param predictions: List of (order, predicted sftt) of the prediction_service.
+    """
+    for order, sftt in predictions:
+        order.prd = order.due_date - sftt - release_slack
+        plan_release(order)
+
+
+def plan_release(order):
+    """
+    Stores the order in the order_pool_dict under the period of its planned release date.
+    :param order: The order with its planned release date.
+    """
     global order_pool_dict
 
-    order.prd = order.due_date - (len(routing.get(order.product_type)) * 100)
-    release_period = int((order.prd) / 1440)
+    release_period = int((order.prd) / period_length)
 
     if release_period in order_pool_dict.keys():
         order_pool_dict[release_period].append(order)
@@ -284,6 +406,58 @@ def ir(order_pool):
     return release_list
 
 
+# Release configuration
+release_function = bil
+release_pool = order_pool_dict
+sequencing_function = earliest_prd
+
+
+def release_scheduler(environment):
+    """
+    This process releases the orders on the exact period boundaries, independent of the order arrivals.
+    If release_on_starvation is set, the orders of the current period are additionally released as soon as a
+    station runs out of orders.
+    :param environment: SimPy Environment()
+    """
+    global period
+    global starvation_event
+
+    while True:
+        period_end = environment.timeout(period * period_length - environment.now)
+        if release_on_starvation:
+            starvation_event = environment.event()
+            yield period_end | starvation_event
+        else:
+            yield period_end
+
+        if environment.now >= period * period_length:
+            # Increase period for periodic release
+            period += 1
+
+        # Predict the SFTT of all orders created since the last release at once
+        if prediction_service is not None:
+            predicted_sftt(prediction_service.predict_pending(period))
+
+        for order_created in sequencing_function(release_function(release_pool)):
+            # Send order to the first stations
+            environment.process(order_created.get_station())
+
+            # Track order release
+            order_track_release(order_created, environment)
+
+
+def check_starvation(station):
+    """
+    Checks whether the station has neither an order in process nor in its queue and informs the release scheduler.
+    :param station: The station the order left.
+    """
+    global starvation_event
+
+    if starvation_event is not None and not starvation_event.triggered:
+        if station.machine.count == 0 and len(station.machine.queue) == 0:
+            starvation_event.succeed()
+
+
 def track_order(due_date, product_type, station_number, time):
     """
     This function first checks if the order visited its last station (this means the order is finished) and later
@@ -295,9 +469,7 @@ def track_order(due_date, product_type, station_number, time):
     """
     global finished_orders
     global early_orders
-    global earliness_list
     global tardy_orders
-    global tardiness_list
 
     if station_number == routing.get(product_type)[-1]:
         finished_orders += 1
@@ -306,11 +478,11 @@ def track_order(due_date, product_type, station_number, time):
         if time < due_date:
             early_orders += 1
             earliness = due_date - time
-            earliness_list.append(earliness)
+            earliness_statistics.add(earliness)
         else:
             tardy_orders += 1
-            tardiness = due_date - time
-            tardiness_list.append(tardiness)
+            tardiness = time - due_date
+            tardiness_statistics.add(tardiness)
 
 
 class Order:
@@ -335,6 +507,7 @@ class Order:
         self.product_type = product_type
         self.due_date = due_date
         self.prd = 0
+        self.processing_times = None  # Recorded processing times, if the order is replayed from a trace
 
     def handle_order(self, station):
         """
@@ -344,20 +517,33 @@ class Order:
 
         # Order requests the station
         with station.machine.request() as request:
-            print(f"Order with order_id {self.order_id} arrives at station {station.number} at {self.env.now}")
+            if verbose:
+                print(f"Order with order_id {self.order_id} arrives at station {station.number} at {self.env.now}")
             yield request
             # Get Processing time
-            processing_time = expon.rvs(scale=100).round()
+            operation = routing.get(self.product_type).index(station.number)
+            if self.processing_times is not None and not np.isnan(self.processing_times[operation]):
+                processing_time = self.processing_times[operation]
+            elif random_streams is not None:
+                processing_time = random_streams.processing_time(station.number, processing_time_mean)
+            else:
+                processing_time = np.round(np.random.exponential(scale=processing_time_mean))
+            order_track_processing(self, operation, processing_time)
             # Use the station
-            print(f"Order with order_id {self.order_id} is going to be processed at station {station.number} at "
-                  f"{self.env.now} with processing time {processing_time}")
+            if verbose:
+                print(f"Order with order_id {self.order_id} is going to be processed at station {station.number} at "
+                      f"{self.env.now} with processing time {processing_time}")
             yield self.env.timeout(processing_time)
-            print(f"Order with order_id {self.order_id} leaves the station {station.number} at {self.env.now}")
+            if verbose:
+                print(f"Order with order_id {self.order_id} leaves the station {station.number} at {self.env.now}")
 
             # Track orders, if finished
             track_order(self.due_date, self.product_type, station.number, self.env.now)
             order_track_finished(self.order_id, self.product_type, self.env, station)
 
+        # Inform the release scheduler, if the station runs out of orders
+        check_starvation(station)
+
     def get_station(self):
         """
         The next station on the product types routing is selected.
@@ -374,69 +560,89 @@ class Order:
             station = stations_list[station - 1]
             yield self.env.process(self.handle_order(station))
 
-    def generate_orders(self):
+    def create_order(self, product_type, due_date, processing_times=None):
         """
-        In this function new orders are created. each order gets an order_id, then a random product type
-        and the orders due date is calculated. A new order is created after the specified time above.
+        A new order is created, tracked and stored in the order pool.
+        :param product_type: The orders' product type.
+        :param due_date: The orders' due date.
+        :param processing_times: Recorded processing times of the orders' operations (None draws them randomly).
         """
         global order_number
-        global period
 
         # Global order_id
         order_number += 1
 
         # Order attributes
         self.order_id = order_number
-        self.product_type = random.randint(1, 5)
-        self.due_date = self.env.now + (random.randint(2, 15) * period_length)
+        self.product_type = product_type
+        self.due_date = due_date
 
         # Create new Order
         order_new = Order(self.env, self.order_id, self.product_type, self.due_date)
+        order_new.processing_times = processing_times
 
         # Track order
         order_track_creation(order_new, self.env)
-        collect_features(order_new)
+        features = collect_features(order_new)
 
         # Predict SFTT
-        expected_sftt(order_new)
+        if prediction_service is not None:
+            prediction_service.add_order(order_new, features)
+        else:
+            expected_sftt(order_new)
 
         # Append order to order_pool list
         order_pool.append(order_new)
 
+    def generate_orders(self):
+        """
+        In this function new orders are created. each order gets an order_id, then a random product type
+        and the orders due date is calculated. A new order is created after the specified time above.
+        """
+        self.create_order(*self.draw_order_attributes())
+
         while True:
             yield self.env.timeout(new_order_time)
 
-            # Increase order_id
-            order_number += 1
+            self.create_order(*self.draw_order_attributes())
 
-            # Order attributes
-            self.order_id = order_number
-            self.product_type = random.randint(1, 5)
-            self.due_date = self.env.now + (random.randint(2, 15) * period_length)
+    def draw_order_attributes(self):
+        """
+        Draws the product type and the due date of a new order.
+        :return: Returns the product type and the due date.
+        """
+        if random_streams is not None:
+            product_type = random_streams.integer('product_type', 1, 5)
+        else:
+            product_type = random.randint(1, 5)
 
-            # Create new order
-            order_new = Order(self.env, self.order_id, self.product_type, self.due_date)
+        return product_type, self.draw_due_date()
 
-            # Track order
-            order_track_creation(order_new, self.env)
-            collect_features(order_new)
+    def draw_due_date(self):
+        """
+        Draws the due date of a new order, 2 to 15 days from now.
+        :return: Returns the due date.
+        """
+        if random_streams is not None:
+            return self.env.now + (random_streams.integer('due_date', 2, 15) * day_length)
 
-            # Predict SFTT
-            expected_sftt(order_new)
+        return self.env.now + (random.randint(2, 15) * day_length)
 
-            # Append order to order_pool list
-            order_pool.append(order_new)
+    def replay_orders(self):
+        """
+        Instead of random draws the orders of the trace are created at their recorded arrival time. Due dates
+        and processing times missing in the trace (NaN) are drawn randomly.
+        """
+        global trace
 
-            if self.env.now >= period * period_length:
-                # Increase period for periodic release
-                period += 1
+        for record in trace:
+            yield self.env.timeout(max(float(record['time_created']) - self.env.now, 0))
 
-                for order_created in earliest_prd(bil(order_pool_dict)):
-                    # Send order to the first stations
-                    self.env.process(order_created.get_station())
+            due_date = float(record['due_date'])
+            if np.isnan(due_date):
+                due_date = self.draw_due_date()
 
-                    # Track order release
-                    order_track_release(order_created, self.env)
+            self.create_order(int(record['product_type']), due_date, record['processing_times'])
 
 
 # Initialize the station class
@@ -451,39 +657,104 @@ class Station:
         self.machine = simpy.Resource(environment, 1)
 
 
-# Create 3 stations
-station1 = Station(1, env)
-station2 = Station(2, env)
-station3 = Station(3, env)
+def setup_simulation(seed=None):
+    """
+    Resets the global lists and counters of the previous run, creates a new environment with its stations and
+    starts the order generation and the release scheduler. The returned environment can be run step by step.
+    :param seed: The seed of the random numbers (None does not seed).
+    :return: Returns the new SimPy Environment().
+    """
+    global env
+    global stations_list
+    global finished_orders
+    global early_orders
+    global tardy_orders
+    global order_number
+    global period
+    global starvation_event
+    global order_tracking_df
+    global order_features_df
+    global sftt_statistics
+    global earliness_statistics
+    global tardiness_statistics
+    global trace
+
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    # Reset the global lists / counters
+    env = simpy.Environment()
+    stations_list = []
+    finished_orders = 0
+    early_orders = 0
+    tardy_orders = 0
+    order_number = 0
+    period = 1
+    starvation_event = None
+    order_pool.clear()
+    order_pool_dict.clear()
+    order_tracking_dict.clear()
+    recent_sftt.clear()
+    sftt_statistics = MetricSummary(keep_values=keep_raw_values)
+    earliness_statistics = MetricSummary(keep_values=keep_raw_values)
+    tardiness_statistics = MetricSummary(keep_values=keep_raw_values)
+    order_tracking_df = None
+    order_features_df = None
+    if prediction_service is not None:
+        prediction_service.reset()
+
+    # Create 3 stations
+    for number in range(1, 4):
+        stations_list.append(Station(number, env))
+
+    # Create instance of class Order
+    order = Order(env, 1, 1, 1)
+
+    if trace_file is not None:
+        trace = load_trace(trace_file)
+        env.process(order.replay_orders())
+    else:
+        env.process(order.generate_orders())
+    env.process(release_scheduler(env))
+
+    if live_monitor is not None:
+        env.process(live_monitor.monitor(env, current_metrics))
 
-# Append stations to the stations_list
-stations_list.append(station1)
-stations_list.append(station2)
-stations_list.append(station3)
+    return env
 
-# Create instance of class Order
-order = Order(env, 1, 1, 1)
 
-env.process(order.generate_orders())
+def run_simulation(sim_time=SIM_TIME, seed=None):
+    """
+    Sets up and runs one replication of the simulation.
+    :param sim_time: The simulation run time.
+    :param seed: The seed of the random numbers (None does not seed).
+    :return: Returns the SimPy Environment() after the run.
+    """
+    environment = setup_simulation(seed=seed)
+    environment.run(until=sim_time)
+
+    return environment
 
-# Simulation RunTime
-env.run(until=SIM_TIME)
 
-# Print Performance
-scenario = 'IR_EDD'
-print(f"###{scenario}: In total {order_number} Orders were created.")
-print(f"###{scenario}: {finished_orders} Orders were finished.")
-print(f"###{scenario}: {early_orders} Orders were finished in time.")
-print(f"###{scenario}: {tardy_orders} Orders were finished too late.")
-mean_earliness = np.sum(earliness_list) / early_orders
-mean_tardiness = np.sum(tardiness_list) / tardy_orders
-print(f"###{scenario}: Mean earliness {mean_earliness}.")
-print(f"###{scenario}: Mean tardiness {mean_tardiness}.")
+if __name__ == '__main__':
+    # Simulation RunTime
+    run_simulation(SIM_TIME)
 
-l = order_tracking_df
-f = order_features_df
+    # Print Performance
+    scenario = 'IR_EDD'
+    print(f"###{scenario}: In total {order_number} Orders were created.")
+    print(f"###{scenario}: {finished_orders} Orders were finished.")
+    print(f"###{scenario}: {early_orders} Orders were finished in time.")
+    print(f"###{scenario}: {tardy_orders} Orders were finished too late.")
+    mean_earliness = earliness_statistics.mean
+    # Printed as due date - time finished, like the earliness
+    mean_tardiness = -tardiness_statistics.mean
+    print(f"###{scenario}: Mean earliness {mean_earliness}.")
+    print(f"###{scenario}: Mean tardiness {mean_tardiness}.")
+    print(f"###{scenario}: Tardiness p50 / p90 / p99 {tardiness_statistics.percentiles()}.")
 
-final_df = order_tracking_df.merge(order_features_df, how='left', left_on=order_tracking_df['order_id'],
-                                   right_on=order_features_df['order_id'])
+    final_df = order_tracking_df.merge(order_features_df, how='left', left_on=order_tracking_df['order_id'],
+                                       right_on=order_features_df['order_id'])
 
-final_df.to_csv('name.csv')
+    final_df.to_csv('name.csv')
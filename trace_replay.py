@@ -0,0 +1,77 @@
+# Imports
+import numpy as np
+
+# Maximum number of operations on a routing
+max_operations = 3
+
+# Binary layout of one recorded order
+trace_dtype = np.dtype([('time_created', np.float64),
+                        ('product_type', np.int32),
+                        ('due_date', np.float64),
+                        ('processing_times', np.float64, (max_operations,))])
+
+
+def convert_csv_to_trace(csv_path, trace_path, interarrival_time=80):
+    """
+    Converts a CSV with recorded orders (e.g. the exported tracking / feature CSV) into the binary trace format.
+    Only the column product_type is required. Missing time_created values are filled with a constant
+    interarrival time, missing due dates and processing times are stored as NaN and drawn randomly during
+    the replay.
+    :param csv_path: Path of the CSV with one recorded order per row.
+    :param trace_path: Path of the .npy file the trace is written to.
+    :param interarrival_time: Time between two orders, if the CSV has no time_created column.
+    :return: Returns the number of orders written to the trace.
+    """
+    import pandas as pd
+
+    csv_df = pd.read_csv(csv_path)
+    if 'product_type' not in csv_df.columns:
+        raise ValueError(f"The CSV {csv_path} has no column product_type.")
+
+    trace = np.zeros(len(csv_df), dtype=trace_dtype)
+    trace['product_type'] = csv_df['product_type'].to_numpy()
+
+    if 'time_created' in csv_df.columns:
+        trace['time_created'] = csv_df['time_created'].to_numpy()
+    else:
+        trace['time_created'] = np.arange(len(csv_df)) * interarrival_time
+
+    if 'due_date' in csv_df.columns:
+        trace['due_date'] = csv_df['due_date'].to_numpy()
+    else:
+        trace['due_date'] = np.nan
+
+    # Processing time of each operation on the routing (processing_time_1, processing_time_2, ...)
+    for operation in range(max_operations):
+        column = f'processing_time_{operation + 1}'
+        if column in csv_df.columns:
+            trace['processing_times'][:, operation] = csv_df[column].to_numpy()
+        else:
+            trace['processing_times'][:, operation] = np.nan
+
+    # The replay expects the orders sorted by their arrival
+    trace = trace[np.argsort(trace['time_created'], kind='stable')]
+    np.save(trace_path, trace)
+
+    return len(trace)
+
+
+def load_trace(trace_path):
+    """
+    Opens a trace memory-mapped and read-only. Only the pages which are replayed are read from disk and
+    parallel replications opening the same file share them through the page cache.
+    :param trace_path: Path of the .npy trace file.
+    :return: Returns the trace as structured numpy array.
+    """
+    trace = np.load(trace_path, mmap_mode='r')
+    if trace.dtype != trace_dtype:
+        raise ValueError(f"The file {trace_path} is not a trace file (dtype {trace.dtype}).")
+
+    return trace
+
+
+if __name__ == '__main__':
+    import sys
+
+    nb_orders = convert_csv_to_trace(sys.argv[1], sys.argv[2])
+    print(f"###Trace: {nb_orders} Orders were written to {sys.argv[2]}.")
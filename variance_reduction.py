@@ -0,0 +1,187 @@
+# Imports
+from concurrent.futures import ProcessPoolExecutor
+import math
+import zlib
+import numpy as np
+
+
+class RandomStreams:
+    """
+    This class contains one random number stream per purpose (product types, due dates and the processing times of
+    each station). Because every purpose has its own stream, different configurations simulated with the same seed
+    use common random numbers, and with antithetic=True every uniform U is replaced by 1 - U.
+    """
+
+    def __init__(self, seed, antithetic=False, block_size=1024):
+        """
+        Here the variables for the streams are defined.
+        :param seed: The seed of the replication.
+        :param antithetic: Use the antithetic uniforms 1 - U.
+        :param block_size: Number of uniforms drawn at once per stream.
+        """
+        self.seed = seed
+        self.antithetic = antithetic
+        self.block_size = block_size
+        self.generators = dict()
+        self.blocks = dict()
+        self.positions = dict()
+        self.processing_time_sum = 0.0  # Sum and number of all processing times (control variate)
+        self.processing_time_count = 0
+
+    def uniform(self, purpose):
+        """
+        Takes the next uniform random number of the purposes' stream.
+        :param purpose: Name of the stream, e.g. 'product_type' or 'processing_1'.
+        :return: Returns a uniform random number in [0, 1).
+        """
+        position = self.positions.get(purpose, self.block_size)
+        if position == self.block_size:
+            if purpose not in self.generators.keys():
+                # The stream depends only on the seed and the purpose, not on the order the streams are used
+                self.generators[purpose] = np.random.default_rng([self.seed, zlib.crc32(purpose.encode())])
+            block = self.generators[purpose].random(self.block_size)
+            self.blocks[purpose] = 1 - block if self.antithetic else block
+            position = 0
+
+        self.positions[purpose] = position + 1
+        return self.blocks[purpose][position]
+
+    def integer(self, purpose, low, high):
+        """
+        Draws a random integer between low and high (both included) by inversion.
+        :param purpose: Name of the stream.
+        :param low: The lowest integer.
+        :param high: The highest integer.
+        :return: Returns the random integer.
+        """
+        return min(low + int(self.uniform(purpose) * (high - low + 1)), high)
+
+    def processing_time(self, station_number, mean):
+        """
+        Draws an exponential processing time of the station by inversion and rounds it like the model.
+        :param station_number: The number of the station.
+        :param mean: The mean processing time.
+        :return: Returns the rounded processing time.
+        """
+        processing_time = round(-mean * math.log(1 - self.uniform(f'processing_{station_number}')))
+        self.processing_time_sum += processing_time
+        self.processing_time_count += 1
+
+        return processing_time
+
+
+def rounded_exponential_mean(mean):
+    """
+    Calculates the exact mean of a rounded exponential processing time, the known mean of the control variate.
+    :param mean: The mean of the exponential distribution.
+    :return: Returns the mean of the rounded processing time.
+    """
+    return math.exp(-0.5 / mean) / (1 - math.exp(-1 / mean))
+
+
+def confidence_interval(values, confidence=0.95):
+    """
+    Calculates the mean and the half width of the t confidence interval.
+    :param values: The independent observations.
+    :param confidence: The confidence level.
+    :return: Returns the mean and the half width.
+    """
+    from scipy.stats import t
+
+    values = np.asarray(values, dtype=float)
+    half_width = t.ppf((1 + confidence) / 2, len(values) - 1) * values.std(ddof=1) / math.sqrt(len(values))
+
+    return values.mean(), half_width
+
+
+def run_replication(seed, sim_time, antithetic=False):
+    """
+    Runs one replication of the third article's model with dedicated random number streams.
+    :param seed: The seed of the replication.
+    :param sim_time: The simulation run time.
+    :param antithetic: Use the antithetic random numbers.
+    :return: Returns a dict with the mean earliness, the mean tardiness (positive) and the mean processing time.
+    """
+    import third_article_features as model
+
+    # The worker processes are reused, so the changed parameters are restored after the replication
+    streams = RandomStreams(seed, antithetic)
+    parameters = {'verbose': False, 'collect_dataframes': False, 'random_streams': streams}
+    original_parameters = {name: getattr(model, name) for name in parameters.keys()}
+    try:
+        for name, value in parameters.items():
+            setattr(model, name, value)
+        model.run_simulation(sim_time)
+    finally:
+        for name, value in original_parameters.items():
+            setattr(model, name, value)
+
+    return {'mean_earliness': model.earliness_statistics.total / max(model.early_orders, 1),
+            'mean_tardiness': model.tardiness_statistics.total / max(model.tardy_orders, 1),
+            'mean_processing_time': streams.processing_time_sum / max(streams.processing_time_count, 1),
+            }
+
+
+def antithetic_estimate(seeds, sim_time, metric='mean_tardiness', confidence=0.95, max_workers=None):
+    """
+    Estimates the metric from antithetic pairs: every seed is simulated with U and 1 - U and the pair average is
+    one observation.
+    :param seeds: The seeds of the pairs.
+    :param sim_time: The simulation run time of each replication.
+    :param metric: The metric returned by run_replication().
+    :param confidence: The confidence level.
+    :param max_workers: Number of worker processes (None uses all CPUs).
+    :return: Returns the mean and the half width of the confidence interval.
+    """
+    seeds = list(seeds)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        originals = executor.map(run_replication, seeds, [sim_time] * len(seeds), [False] * len(seeds))
+        antithetics = executor.map(run_replication, seeds, [sim_time] * len(seeds), [True] * len(seeds))
+        pair_means = [(original[metric] + antithetic[metric]) / 2
+                      for original, antithetic in zip(originals, antithetics)]
+
+    return confidence_interval(pair_means, confidence)
+
+
+def control_variate_estimate(values, controls, known_mean, confidence=0.95):
+    """
+    Adjusts the observations with a control variate of known mean, e.g. the mean processing time of each
+    replication with the known mean rounded_exponential_mean(100).
+    :param values: The observations of the metric.
+    :param controls: The observations of the control variate.
+    :param known_mean: The known mean of the control variate.
+    :param confidence: The confidence level.
+    :return: Returns the adjusted mean and the half width of the confidence interval.
+    """
+    values = np.asarray(values, dtype=float)
+    controls = np.asarray(controls, dtype=float)
+
+    beta = np.cov(values, controls, ddof=1)[0, 1] / controls.var(ddof=1)
+    adjusted = values - beta * (controls - known_mean)
+
+    return confidence_interval(adjusted, confidence)
+
+
+def control_variate_replications(seeds, sim_time, metric='mean_tardiness', processing_mean=None, confidence=0.95,
+                                 max_workers=None):
+    """
+    Runs independent replications and estimates the metric with the mean processing time as control variate.
+    :param seeds: The seeds of the replications.
+    :param sim_time: The simulation run time of each replication.
+    :param metric: The metric returned by run_replication().
+    :param processing_mean: The mean processing time of the stations (None uses processing_time_mean of the model).
+    :param confidence: The confidence level.
+    :param max_workers: Number of worker processes (None uses all CPUs).
+    :return: Returns the adjusted mean and the half width of the confidence interval.
+    """
+    if processing_mean is None:
+        import third_article_features as model
+
+        processing_mean = model.processing_time_mean
+    seeds = list(seeds)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run_replication, seeds, [sim_time] * len(seeds)))
+
+    return control_variate_estimate([result[metric] for result in results],
+                                    [result['mean_processing_time'] for result in results],
+                                    rounded_exponential_mean(processing_mean), confidence)